@@ -1,18 +1,19 @@
-from dataclasses import dataclass
-from typing import Optional
+from array import array
+from dataclasses import dataclass, field
+from typing import List, Optional
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Condition:
     variable: str
     operator: str  # "=" or "!="
     value: str
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class OrCondition:
     left: Condition
     right: Condition
 
-@dataclass
+@dataclass(slots=True)
 class TreeNode:
     node_id: int
     or_condition: Optional[OrCondition]       # None if it’s a leaf or a single condition node
@@ -20,3 +21,85 @@ class TreeNode:
     yes_branch: Optional[int]
     no_branch: Optional[int]
     leaf_value: Optional[float]                 # Set only for leaf nodes
+
+# Node ids index dense arrays, so a tree of n nodes (or lines) accepts ids up to
+# max(MAX_ID_SPREAD * n, SPARSE_ID_SLACK); larger ids would allocate rows for every id below them.
+MAX_ID_SPREAD = 4
+SPARSE_ID_SLACK = 1 << 16
+
+def max_node_id(n_nodes: int) -> int:
+    """
+    Returns the largest node id accepted for a tree of n_nodes nodes.
+    """
+    return max(MAX_ID_SPREAD * n_nodes, SPARSE_ID_SLACK)
+
+def node_id_error(node_id: int, limit: int) -> ValueError:
+    """
+    Returns the error for a node id above the limit max_node_id allows.
+    """
+    return ValueError(f"Node id {node_id} is out of range: node ids must be dense, at most {limit} for this tree")
+
+# Node kinds stored in TreeArrays.kind; KIND_NONE marks an id the tree does not define.
+KIND_NONE, KIND_LEAF, KIND_SINGLE, KIND_OR = -1, 0, 1, 2
+
+@dataclass(slots=True)
+class TreeArrays:
+    """
+    A whole tree as parallel columns indexed by node id. Indexing it returns a TreeNode view of
+    that row, or None for an id the tree does not define; an OR node's OrCondition is only built
+    then, from its two condition columns.
+    """
+    conditions: List[Condition] = field(default_factory=list)   # Distinct simple conditions
+    kind: array = field(default_factory=lambda: array("b"))      # KIND_* of each node
+    cond_a: array = field(default_factory=lambda: array("i"))    # Index into conditions: the condition, or an OR's left
+    cond_b: array = field(default_factory=lambda: array("i"))    # Index into conditions: an OR's right, -1 otherwise
+    yes: array = field(default_factory=lambda: array("i"))       # -1 if none
+    no: array = field(default_factory=lambda: array("i"))        # -1 if none
+    leaf: array = field(default_factory=lambda: array("d"))
+
+    def __len__(self) -> int:
+        return len(self.kind)
+
+    def __getitem__(self, node_id: int) -> Optional[TreeNode]:
+        kind = self.kind[node_id]
+        if kind == KIND_NONE:
+            return None
+        if kind == KIND_LEAF:
+            return TreeNode(
+                node_id=node_id,
+                or_condition=None,
+                single_condition=None,
+                yes_branch=None,
+                no_branch=None,
+                leaf_value=self.leaf[node_id]
+            )
+        cond = self.conditions[self.cond_a[node_id]]
+        if kind == KIND_OR:
+            or_cond = OrCondition(left=cond, right=self.conditions[self.cond_b[node_id]])
+            cond = None
+        else:
+            or_cond = None
+        return TreeNode(
+            node_id=node_id,
+            or_condition=or_cond,
+            single_condition=cond,
+            yes_branch=self.yes[node_id],
+            no_branch=self.no[node_id],
+            leaf_value=None
+        )
+
+    def resize(self, size: int) -> None:
+        """
+        Grows or truncates every column to size rows; new rows define no node.
+        """
+        extra = size - len(self)
+        if extra <= 0:
+            for column in (self.kind, self.cond_a, self.cond_b, self.yes, self.no, self.leaf):
+                del column[size:]
+            return
+        self.kind.extend(array("b", [KIND_NONE]) * extra)
+        self.cond_a.extend(array("i", [-1]) * extra)
+        self.cond_b.extend(array("i", [-1]) * extra)
+        self.yes.extend(array("i", [-1]) * extra)
+        self.no.extend(array("i", [-1]) * extra)
+        self.leaf.extend(array("d", [0.0]) * extra)
@@ -1,45 +1,419 @@
-from typing import Dict, Generator, List, Optional
-from .datamodel import TreeNode, Condition, OrCondition
+import multiprocessing
+import os
+from typing import Dict, Generator, List, Optional, Sequence, Tuple, Union
+from dataclasses import replace
+from .datamodel import KIND_LEAF, KIND_NONE, KIND_OR, TreeArrays, TreeNode, Condition, OrCondition, max_node_id
 
-def add_simple_constraint(constraints: Dict[str, tuple], var: str, op: str, val: str) -> Optional[Dict[str, tuple]]:
+# Integer operator codes; the negation of an operator is op ^ 1.
+EQ, NE = 0, 1
+OPERATOR_CODES = {"=": EQ, "!=": NE}
+
+# A condition compiled to interned ids: (variable_id, operator, value_bit, text, negated_text).
+# Values are carried as their bit (1 << value_id) so the DFS never shifts.
+CompiledCondition = Tuple[int, int, int, str, str]
+
+# A condition to install when taking an edge: (variable_id, operator, value_bit, text).
+EdgeCondition = Tuple[int, int, int, str]
+
+# Number of strategies the DFS collects before handing them to its consumer.
+BATCH_SIZE = 4096
+
+# Encoded output is accumulated up to this many bytes before it is written out, so the
+# kernel sees few large writes.
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+def _iov_max() -> int:
+    try:
+        limit = os.sysconf("SC_IOV_MAX")
+    except (AttributeError, ValueError, OSError):
+        return 1024
+    return limit if limit > 0 else 1024
+
+# Most buffers a single os.writev call accepts (Linux rejects more with EINVAL).
+IOV_MAX = _iov_max()
+
+# Target number of independent subtrees handed out per worker process by flatten_parallel.
+SEEDS_PER_PROCESS = 8
+
+# Shared record field for memoized leaves whose path kept every entry condition.
+NOTHING_DROPPED: frozenset = frozenset()
+
+# An outgoing edge of a node: (child_id, conditions that must all hold to take it).
+Edge = Tuple[int, Tuple[EdgeCondition, ...]]
+
+def try_add(
+    eq: List[int], ineq: List[int], trail: List[tuple], cond_strings: List[str], ne_texts: List[List[str]],
+    var: int, op: int, bit: int, text: str
+) -> bool:
     """
-    Returns a new copy of constraints with the new simple condition added.
-    constraints: dict mapping variable -> (equality: Optional[str], inequalities: Set[str])
-    op: "=" or "!=".
-    If the new condition causes a contradiction, returns None.
+    Adds a simple condition to the constraints in place, recording how to undo it on trail.
+    eq: variable id -> bit of the value it must equal, or 0 when unconstrained.
+    ineq: variable id -> bitmask of disallowed value ids (bit i set means "!= value i").
+    bit: the condition's value as 1 << value_id.
+    trail: stack of (variable_id, added_inequality_bit_or_-1, saved_cond_strings) undo records.
+    cond_strings: the rendered conditions of the current path, kept in step with trail.
+    ne_texts: variable id -> value id -> rendered inequality, used to drop superseded inequalities.
+    text: the rendered form of this condition, appended to cond_strings when it takes effect.
+    Every record pushed on trail appends exactly one string to cond_strings; redundant
+    conditions push neither.
+    If the new condition causes a contradiction, returns False and leaves constraints untouched.
     """
-    # Create a deep copy of constraints for the current path.
-    new_constraints = {k: (v[0], set(v[1])) for k, v in constraints.items()}
-    if var in new_constraints:
-        eq, ineq = new_constraints[var]
-        if op == "=":
-            # Adding an equality condition.
-            if eq is None:
-                new_constraints[var] = (val, ineq)
-                if val in ineq:
-                    # Contradiction: cannot equal a disallowed value.
-                    return None
-            else:
-                if eq != val:
-                    return None  # Conflict with existing equality.
-                # If eq is already val, no change needed.
-        elif op == "!=":
-            if eq is not None:
-                if eq == val:
-                    return None  # Contradiction: value equals its disallowed value.
-                # Otherwise, inequality is redundant.
-            else:
-                new_constraints[var][1].add(val)
+    current = eq[var]
+    if op == EQ:
+        if current:
+            # Either already equal (no change needed) or a conflict with the existing equality.
+            return current == bit
+        mask = ineq[var]
+        saved = None
+        if mask:
+            if mask & bit:
+                # Contradiction: cannot equal a disallowed value.
+                return False
+            # The equality makes the variable's inequalities redundant, so drop them from the path.
+            saved = cond_strings.copy()
+            texts = ne_texts[var]
+            dropped = {texts[v] for v in range(mask.bit_length()) if mask >> v & 1}
+            cond_strings[:] = [c for c in saved if c not in dropped]
+        eq[var] = bit
+        cond_strings.append(text)
+        trail.append((var, -1, saved))
     else:
-        if op == "=":
-            new_constraints[var] = (val, set())
+        if current:
+            # Contradiction if equal to the disallowed value, otherwise the inequality is redundant.
+            return current != bit
+        mask = ineq[var]
+        if not mask & bit:
+            ineq[var] = mask | bit
+            cond_strings.append(text)
+            trail.append((var, bit, None))
+    return True
+
+def try_add_both(
+    eq: List[int], ineq: List[int], trail: List[tuple], cond_strings: List[str], ne_texts: List[List[str]],
+    first: EdgeCondition, second: EdgeCondition
+) -> int:
+    """
+    Adds two conditions that must hold together (the negated halves of an OR node), as one
+    atomic step. Returns the number of trail records pushed, or -1 if either condition causes
+    a contradiction, in which case the constraints are rolled back to their prior state.
+    """
+    mark = len(trail)
+    var, op, bit, text = first
+    if not try_add(eq, ineq, trail, cond_strings, ne_texts, var, op, bit, text):
+        return -1
+    var, op, bit, text = second
+    if not try_add(eq, ineq, trail, cond_strings, ne_texts, var, op, bit, text):
+        unwind(eq, ineq, trail, cond_strings, mark)
+        return -1
+    return len(trail) - mark
+
+def record_leaf(recorders: List[tuple], path: List[str], leaf_text: str) -> None:
+    """
+    Adds a leaf reached with the given path conditions to every active memo recording.
+    recorders: stack of (key, entry_path, entry_path_set, records) for the memoized subtrees
+    currently being explored. The surviving entry conditions always lead the path, and what
+    follows them is the subtree's suffix. Each record is (dropped_entry_conditions, suffix,
+    leaf_text), where dropped conditions are inequalities an equality in the subtree superseded.
+    """
+    for _, entry_path, entry_set, records in recorders:
+        kept = 0
+        for cond in path:
+            if cond not in entry_set:
+                break
+            kept += 1
+        dropped = entry_set.difference(path[:kept]) if kept < len(entry_path) else NOTHING_DROPPED
+        records.append((frozenset(dropped), tuple(path[kept:]), leaf_text))
+
+def write_all(fd: int, chunks: List[bytes]) -> None:
+    """
+    Writes chunks to the raw file descriptor fd with scatter-gather writes of at most IOV_MAX
+    buffers where available, finishing any partial write with plain writes.
+    """
+    if not hasattr(os, "writev"):
+        data = memoryview(b"".join(chunks))
+        while data:
+            data = data[os.write(fd, data):]
+        return
+    for start in range(0, len(chunks), IOV_MAX):
+        group = chunks[start:start + IOV_MAX]
+        written = os.writev(fd, group)
+        if written == sum(map(len, group)):
+            continue
+        data = memoryview(b"".join(group))[written:]
+        while data:
+            data = data[os.write(fd, data):]
+
+def unwind(eq: List[int], ineq: List[int], trail: List[tuple], cond_strings: List[str], mark: int) -> None:
+    """
+    Pops trail records down to mark, restoring constraints and cond_strings to the state they had at that point.
+    """
+    while len(trail) > mark:
+        var, added, saved = trail.pop()
+        if saved is not None:
+            cond_strings[:] = saved
+        else:
+            cond_strings.pop()
+        if added == -1:
+            eq[var] = 0
         else:
-            new_constraints[var] = (None, {val})
-    return new_constraints
+            ineq[var] ^= added
+
+# The flattener a flatten_parallel worker process runs seeds against, set by _init_worker.
+_worker_flattener: Optional["TreeFlattener"] = None
+
+def _init_worker(flattener: "TreeFlattener") -> None:
+    global _worker_flattener
+    _worker_flattener = flattener
+
+def _flatten_seed(seed: Tuple[int, Tuple[EdgeCondition, ...]]) -> list:
+    """
+    Worker entry point: flattens the subtree at seed = (node_id, path_conditions).
+    """
+    node_id, path = seed
+    strategies = []
+    for batch in _worker_flattener._dfs_collect_strategies(node_id, path=path):
+        strategies.extend(batch)
+    return strategies
 
 class TreeFlattener:
-    def __init__(self, nodes: Dict[int, TreeNode]):
-        self.nodes = nodes
+    def __init__(
+        self, nodes: Union[TreeArrays, Dict[int, TreeNode], Sequence[Optional[TreeNode]]], memoize: bool = False
+    ):
+        """
+        nodes: the tree, either the TreeArrays returned by TreeParser.parse, a dictionary mapping
+        node IDs to nodes, or a list indexed by node ID with None for missing IDs.
+        memoize: cache the strategies of subtrees reachable along more than one edge (such as
+        the YES child of an OR node), keyed by the constraints on the variables the subtree uses,
+        and replay them instead of exploring the subtree again. Costs memory proportional to
+        the output of those subtrees.
+        """
+        self.memoize = memoize
+        # Intern variable names into dense integer ids, and each variable's values into its own
+        # dense id space so the inequality bitmasks stay small. The names are kept for output.
+        self.var_ids: Dict[str, int] = {}
+        self.var_names: List[str] = []
+        self.val_ids: List[Dict[str, int]] = []
+        self.val_names: List[List[str]] = []
+        # The tree as parallel arrays indexed by node id (ids are small dense ints): whether the id
+        # is a node at all, the leaf value of every leaf, and the outgoing edges of every condition
+        # node, compiled once and stored in reverse visiting order so they can be pushed straight
+        # onto the DFS stack.
+        self.defined: List[bool] = []
+        # Node id -> table index, for dict trees whose ids are too sparse to index the tables
+        # directly; None when ids are the indexes.
+        self.node_index: Optional[Dict[int, int]] = None
+        self.leaf_values: List[Optional[float]] = []
+        self.edges: List[List[Edge]] = []
+        if isinstance(nodes, TreeArrays):
+            self._load_arrays(nodes)
+        else:
+            if not isinstance(nodes, dict):
+                nodes = {node_id: node for node_id, node in enumerate(nodes) if node is not None}
+            self._load_nodes(nodes)
+        size = len(self.edges)
+        for node_id, node_edges in enumerate(self.edges):
+            for child_id, _ in node_edges:
+                if not 0 <= child_id < size or not self.defined[child_id]:
+                    raise ValueError(f"Node {node_id}: unknown child node {child_id}")
+        self.n_vars = len(self.var_names)
+        self.ne_texts: List[List[str]] = [
+            [f"{variable}!={value}" for value in values]
+            for variable, values in zip(self.var_names, self.val_names)
+        ]
+        # The text after a leaf's conditions; a leaf with no conditions drops the leading space.
+        self.leaf_texts: List[Optional[str]] = [
+            None if leaf_value is None else f" : {leaf_value}" for leaf_value in self.leaf_values
+        ]
+        # The post-order pass also rejects cyclic trees, which the explicit-stack DFS would
+        # otherwise explore forever.
+        order = self._post_order()
+        if memoize:
+            self.vars_below = self._collect_vars_below(order)
+            indegree = [0] * size
+            for edges in self.edges:
+                for child_id, _ in edges:
+                    indegree[child_id] += 1
+            self.shared = [n > 1 and self.leaf_values[i] is None for i, n in enumerate(indegree)]
+
+    def _load_nodes(self, nodes: Dict[int, TreeNode]) -> None:
+        """
+        Fills the node tables from TreeNode objects keyed by node id.
+        """
+        if nodes and min(nodes) < 0:
+            raise ValueError(f"Node id {min(nodes)} is out of range: node ids must not be negative")
+        size = max(nodes) + 1 if nodes else 0
+        if size > max_node_id(len(nodes)) + 1:
+            # Sparse ids: number the nodes densely in id order, translating ids through node_index.
+            node_index = self.node_index = {node_id: i for i, node_id in enumerate(sorted(nodes))}
+
+            def renumber(node_id: int, child_id: Optional[int]) -> Optional[int]:
+                if child_id is None:
+                    return None
+                if child_id not in node_index:
+                    raise ValueError(f"Node {node_id}: unknown child node {child_id}")
+                return node_index[child_id]
+
+            nodes = {
+                node_index[node_id]: replace(
+                    node,
+                    node_id=node_index[node_id],
+                    yes_branch=renumber(node_id, node.yes_branch),
+                    no_branch=renumber(node_id, node.no_branch)
+                )
+                for node_id, node in nodes.items()
+            }
+            size = len(nodes)
+        self.defined = [False] * size
+        self.leaf_values = [None] * size
+        self.edges = [[] for _ in range(size)]
+        for node_id, node in nodes.items():
+            self.defined[node_id] = True
+            leaf_value = node.leaf_value
+            if leaf_value is not None:
+                self.leaf_values[node_id] = leaf_value
+                continue
+            edges = self.edges[node_id]
+            yes_branch, no_branch = node.yes_branch, node.no_branch
+            or_cond = node.or_condition
+            if or_cond is not None:
+                lv, lo, lbit, ltext, lneg = self._compile(or_cond.left)
+                rv, ro, rbit, rtext, rneg = self._compile(or_cond.right)
+                # Branch YES: split into two DFS paths, one for each alternative.
+                if yes_branch is not None:
+                    edges.append((yes_branch, ((lv, lo, lbit, ltext),)))
+                    edges.append((yes_branch, ((rv, ro, rbit, rtext),)))
+                # Branch NO: the OR condition is false, meaning both parts are false.
+                if no_branch is not None:
+                    edges.append((no_branch, ((lv, lo ^ 1, lbit, lneg), (rv, ro ^ 1, rbit, rneg))))
+            elif node.single_condition is not None:
+                var, op, bit, text, neg_text = self._compile(node.single_condition)
+                if yes_branch is not None:
+                    edges.append((yes_branch, ((var, op, bit, text),)))
+                # NO branch: the negation of the condition.
+                if no_branch is not None:
+                    edges.append((no_branch, ((var, op ^ 1, bit, neg_text),)))
+            edges.reverse()
+
+    def _load_arrays(self, tree: TreeArrays) -> None:
+        """
+        Fills the node tables straight from the columns of a parsed tree, compiling each distinct
+        condition once and sharing its edge conditions between all the nodes that use it; no
+        TreeNode or OrCondition is built.
+        """
+        size = len(tree)
+        kinds, cond_a, cond_b = tree.kind, tree.cond_a, tree.cond_b
+        yes, no, leaf = tree.yes, tree.no, tree.leaf
+        yes_conds: List[Tuple[EdgeCondition, ...]] = []
+        no_conds: List[Tuple[EdgeCondition, ...]] = []
+        for cond in tree.conditions:
+            var, op, bit, text, neg_text = self._compile(cond)
+            yes_conds.append(((var, op, bit, text),))
+            no_conds.append(((var, op ^ 1, bit, neg_text),))
+        or_no_conds: Dict[Tuple[int, int], Tuple[EdgeCondition, ...]] = {}
+        self.defined = [kind != KIND_NONE for kind in kinds]
+        self.leaf_values = [None] * size
+        self.edges = [[] for _ in range(size)]
+        for node_id in range(size):
+            kind = kinds[node_id]
+            if kind == KIND_NONE:
+                continue
+            if kind == KIND_LEAF:
+                self.leaf_values[node_id] = leaf[node_id]
+                continue
+            edges = self.edges[node_id]
+            yes_branch, no_branch, left = yes[node_id], no[node_id], cond_a[node_id]
+            # Edges in reverse visiting order: NO, then YES (the right half of an OR before the left).
+            if kind == KIND_OR:
+                right = cond_b[node_id]
+                if no_branch != -1:
+                    both = or_no_conds.get((left, right))
+                    if both is None:
+                        both = or_no_conds[left, right] = no_conds[left] + no_conds[right]
+                    edges.append((no_branch, both))
+                if yes_branch != -1:
+                    edges.append((yes_branch, yes_conds[right]))
+                    edges.append((yes_branch, yes_conds[left]))
+            else:
+                if no_branch != -1:
+                    edges.append((no_branch, no_conds[left]))
+                if yes_branch != -1:
+                    edges.append((yes_branch, yes_conds[left]))
+
+    def _intern(self, ids: Dict[str, int], names: List[str], name: str) -> int:
+        """
+        Returns the id of name, assigning the next free id on first sight.
+        """
+        idx = ids.get(name)
+        if idx is None:
+            idx = ids[name] = len(names)
+            names.append(name)
+        return idx
+
+    def _compile(self, cond: Condition) -> CompiledCondition:
+        """
+        Converts a Condition into interned ids plus its rendered and negated-rendered forms.
+        """
+        variable, value = cond.variable, cond.value
+        var = self._intern(self.var_ids, self.var_names, variable)
+        if var == len(self.val_ids):
+            self.val_ids.append({})
+            self.val_names.append([])
+        val = self._intern(self.val_ids[var], self.val_names[var], value)
+        op = OPERATOR_CODES[cond.operator]
+        eq_text = f"{variable}={value}"
+        ne_text = f"{variable}!={value}"
+        bit = 1 << val
+        return (var, op, bit, eq_text, ne_text) if op == EQ else (var, op, bit, ne_text, eq_text)
+
+    def _post_order(self) -> List[int]:
+        """
+        Returns every node id, each one after all of its children (iterative post-order).
+        Raises ValueError if the edges form a cycle.
+        """
+        # 0: not reached yet, 1: on the current path (children being explored), 2: done.
+        state = [0] * len(self.edges)
+        order: List[int] = []
+        for start in range(len(self.edges)):
+            stack = [(start, False)]
+            while stack:
+                node_id, expanded = stack.pop()
+                if expanded:
+                    state[node_id] = 2
+                    order.append(node_id)
+                    continue
+                if state[node_id]:
+                    continue
+                state[node_id] = 1
+                stack.append((node_id, True))
+                for child_id, _ in self.edges[node_id]:
+                    child_state = state[child_id]
+                    if child_state == 1:
+                        raise ValueError(f"Node {node_id}: child node {child_id} leads back to it (cycle)")
+                    if not child_state:
+                        stack.append((child_id, False))
+        return order
+
+    def _collect_vars_below(self, order: List[int]) -> List[Tuple[int, ...]]:
+        """
+        Returns, for every node id, the sorted ids of the variables its subtree's conditions use.
+        """
+        below: List[frozenset] = [frozenset()] * len(self.edges)
+        for node_id in order:
+            variables = set()
+            for child_id, conds in self.edges[node_id]:
+                variables.update(cond[0] for cond in conds)
+                variables.update(below[child_id])
+            below[node_id] = frozenset(variables)
+        return [tuple(sorted(variables)) for variables in below]
+
+    def _root_index(self, root_id: int) -> int:
+        """
+        Returns the table index of node root_id, raising ValueError if the tree has no such node.
+        """
+        index = root_id if self.node_index is None else self.node_index.get(root_id, -1)
+        if not 0 <= index < len(self.defined) or not self.defined[index]:
+            raise ValueError(f"Unknown root node {root_id}")
+        return index
 
     def flatten(self, root_id: int = 0) -> Generator[str, None, None]:
         """
@@ -50,68 +424,170 @@ class TreeFlattener:
         
         An empty strategy will yield simply ": leaf_value".
         """
-        yield from self._dfs_collect_strategies(root_id, constraints={}, extra_conditions=[])
+        for batch in self._dfs_collect_strategies(self._root_index(root_id)):
+            yield from batch
 
-    def _dfs_collect_strategies(
-        self, node_id: int, 
-        constraints: Dict[str, tuple],
-        extra_conditions: List[str]
-    ) -> Generator[str, None, None]:
-        node = self.nodes[node_id]
-
-        # If we reached a leaf, build and yield the strategy.
-        if node.leaf_value is not None:
-            cond_list = []
-            for var, (eq, ineq) in constraints.items():
-                if eq is not None:
-                    cond_list.append(f"{var}={eq}")
+    def flatten_parallel(self, root_id: int = 0, processes: Optional[int] = None) -> Generator[str, None, None]:
+        """
+        Flattens the tree like flatten(), spreading independent subtrees over a pool of
+        worker processes (one per CPU by default). Strategies are yielded as each subtree
+        finishes, so their order differs from flatten(); each subtree's strategies are held
+        in memory until it is done.
+        """
+        for batch in self._parallel_batches(root_id, processes):
+            yield from batch
+
+    def _parallel_batches(self, root_id: int, processes: Optional[int]) -> Generator[list, None, None]:
+        """
+        Splits the top of the tree into seeds of (node_id, path_conditions) and yields the
+        strategies of each seed's subtree, as computed by a worker, in completion order.
+        """
+        root_index = self._root_index(root_id)
+        processes = processes or os.cpu_count() or 1
+        seeds = self._split_seeds(root_index, processes * SEEDS_PER_PROCESS)
+        with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(self,)) as pool:
+            for strategies in pool.imap_unordered(_flatten_seed, seeds, chunksize=1):
+                if strategies:
+                    yield strategies
+
+    def _split_seeds(self, root_id: int, target: int) -> List[Tuple[int, Tuple[EdgeCondition, ...]]]:
+        """
+        Expands the tree from root_id level by level into (node_id, path_conditions) seeds until
+        there are at least target of them or no seed has children left. Seeds whose path turns
+        out to be contradictory simply produce no strategies.
+        """
+        edges = self.edges
+        seeds: List[Tuple[int, Tuple[EdgeCondition, ...]]] = [(root_id, ())]
+        while len(seeds) < target:
+            expanded = []
+            grew = False
+            for node_id, path in seeds:
+                if edges[node_id]:
+                    grew = True
+                    for child_id, conds in reversed(edges[node_id]):
+                        expanded.append((child_id, path + conds))
                 else:
-                    for disallowed in sorted(ineq):
-                        cond_list.append(f"{var}!={disallowed}")
-            cond_list.extend(extra_conditions)
-            cond_str = " & ".join(cond_list)
-            yield f"{cond_str} : {node.leaf_value}" if cond_str else f": {node.leaf_value}"
-            return
-
-        # Process non-leaf nodes.
-        if node.or_condition is not None:
-            or_cond = node.or_condition
+                    expanded.append((node_id, path))
+            if not grew:
+                break  # Only leaves left.
+            seeds = expanded
+        return seeds
+
+    def flatten_to_file(self, output_path: str, root_id: int = 0, processes: int = 1) -> None:
+        """
+        Batch flattening mode: writes every strategy to output_path, one per line.
+        See flatten_to_fd.
+        """
+        fd = os.open(output_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            self.flatten_to_fd(fd, root_id, processes)
+        finally:
+            os.close(fd)
+
+    def flatten_to_fd(self, fd: int, root_id: int = 0, processes: int = 1) -> None:
+        """
+        Writes every strategy to the raw file descriptor fd as UTF-8, one per line.
+        Each batch from the DFS is joined and encoded in one go, and the encoded batches are
+        written in blocks of about OUTPUT_BUFFER_SIZE bytes, so the kernel sees few large writes.
+        With processes above 1 the tree is flattened by flatten_parallel's worker pool and
+        the strategies are written in completion order.
+        """
+        if processes > 1:
+            batches = self._parallel_batches(root_id, processes)
+        else:
+            batches = self._dfs_collect_strategies(self._root_index(root_id))
+        pending: List[bytes] = []
+        pending_size = 0
+        for batch in batches:
+            batch.append("")  # Terminates the last line of the batch.
+            data = "\n".join(batch).encode("utf-8")
+            pending.append(data)
+            pending_size += len(data)
+            if pending_size >= OUTPUT_BUFFER_SIZE:
+                write_all(fd, pending)
+                pending.clear()
+                pending_size = 0
+        if pending:
+            write_all(fd, pending)
 
-            # Branch YES: split into two DFS paths, one for each alternative.
-            if node.yes_branch is not None:
-                # Option 1: assume left condition is true.
-                constraints_left = add_simple_constraint(constraints.copy(), or_cond.left.variable, or_cond.left.operator, or_cond.left.value)
-                if constraints_left is not None:
-                    yield from self._dfs_collect_strategies(node.yes_branch, constraints_left, extra_conditions.copy())
-                # Option 2: assume right condition is true.
-                constraints_right = add_simple_constraint(constraints.copy(), or_cond.right.variable, or_cond.right.operator, or_cond.right.value)
-                if constraints_right is not None:
-                    yield from self._dfs_collect_strategies(node.yes_branch, constraints_right, extra_conditions.copy())
-
-            # Branch NO: the OR condition is false, meaning both parts are false.
-            if node.no_branch is not None:
-                new_constraints = constraints.copy()
-                # For left: if originally "=" then now "!=" and vice versa.
-                left_neg_op = "!=" if or_cond.left.operator == "=" else "="
-                new_constraints = add_simple_constraint(new_constraints, or_cond.left.variable, left_neg_op, or_cond.left.value)
-                if new_constraints is None:
-                    return  # Branch impossible.
-                right_neg_op = "!=" if or_cond.right.operator == "=" else "="
-                new_constraints = add_simple_constraint(new_constraints, or_cond.right.variable, right_neg_op, or_cond.right.value)
-                if new_constraints is None:
-                    return  # Branch impossible.
-                yield from self._dfs_collect_strategies(node.no_branch, new_constraints, extra_conditions.copy())
-
-        elif node.single_condition is not None:
-            cond = node.single_condition
-
-            # YES branch: add the condition as is.
-            new_constraints_yes = add_simple_constraint(constraints, cond.variable, cond.operator, cond.value)
-            if new_constraints_yes is not None and node.yes_branch is not None:
-                yield from self._dfs_collect_strategies(node.yes_branch, new_constraints_yes, extra_conditions.copy())
-
-            # NO branch: add the negation of the condition.
-            neg_op = "!=" if cond.operator == "=" else "="
-            new_constraints_no = add_simple_constraint(constraints, cond.variable, neg_op, cond.value)
-            if new_constraints_no is not None and node.no_branch is not None:
-                yield from self._dfs_collect_strategies(node.no_branch, new_constraints_no, extra_conditions.copy())
+    def _dfs_collect_strategies(
+        self, root_id: int, batch_size: int = BATCH_SIZE,
+        path: Tuple[EdgeCondition, ...] = ()
+    ) -> Generator[list, None, None]:
+        """
+        Yields the strategies in lists of up to batch_size, so consumers resume this generator
+        once per batch rather than once per leaf.
+        root_id is a table index (see _root_index).
+        path: conditions already taken on the way from the tree's root to root_id, installed
+        before the DFS starts; yields nothing if they contradict each other.
+
+        Iterative DFS over an explicit stack of (node_id, trail_mark, edge_conditions) work items.
+        Popping an item first unwinds the trail back to the mark it was pushed with, which undoes
+        whatever the previously explored sibling subtree installed, then installs the edge's
+        conditions and visits the node. Items whose conditions contradict the path are dropped.
+        With memoization on, a -1 item marks the end of a memoized subtree's exploration.
+        """
+        edges, ne_texts, leaf_texts = self.edges, self.ne_texts, self.leaf_texts
+        sep = " & "
+        eq = [0] * self.n_vars
+        ineq = [0] * self.n_vars
+        trail: List[tuple] = []
+        cond_strings: List[str] = []
+        for var, op, bit, text in path:
+            if not try_add(eq, ineq, trail, cond_strings, ne_texts, var, op, bit, text):
+                return
+        stack: List[Tuple[int, int, Tuple[EdgeCondition, ...]]] = [(root_id, len(trail), ())]
+        batch: List[str] = []
+        memo: Optional[Dict[tuple, List[tuple]]] = {} if self.memoize else None
+        if memo is not None:
+            shared, vars_below = self.shared, self.vars_below
+        recorders: List[tuple] = []
+        while stack:
+            node_id, mark, conds = stack.pop()
+            if len(trail) > mark:
+                unwind(eq, ineq, trail, cond_strings, mark)
+            if node_id < 0:
+                # The memoized subtree on top of the recorders has been fully explored.
+                key, _, _, records = recorders.pop()
+                memo[key] = records
+                continue
+            if len(conds) == 1:
+                var, op, bit, text = conds[0]
+                if not try_add(eq, ineq, trail, cond_strings, ne_texts, var, op, bit, text):
+                    continue  # Branch impossible.
+            elif conds and try_add_both(eq, ineq, trail, cond_strings, ne_texts, conds[0], conds[1]) < 0:
+                continue  # Branch impossible: both halves of the OR cannot be false here.
+            leaf_text = leaf_texts[node_id]
+            # If we reached a leaf, the path's conditions are already rendered in cond_strings.
+            if leaf_text is not None:
+                if recorders:
+                    record_leaf(recorders, cond_strings, leaf_text)
+                batch.append(sep.join(cond_strings) + leaf_text if cond_strings else leaf_text[1:])
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+                continue
+            mark = len(trail)
+            if memo is not None and shared[node_id]:
+                key = (node_id, tuple(
+                    (v, eq[v], ineq[v]) for v in vars_below[node_id] if eq[v] or ineq[v]
+                ))
+                records = memo.get(key)
+                if records is not None:
+                    # Same constraints on every variable below: replay the cached suffixes.
+                    for dropped, suffix, leaf_text in records:
+                        path = [c for c in cond_strings if c not in dropped] if dropped else cond_strings.copy()
+                        path.extend(suffix)
+                        if recorders:
+                            record_leaf(recorders, path, leaf_text)
+                        batch.append(sep.join(path) + leaf_text if path else leaf_text[1:])
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+                    continue
+                recorders.append((key, cond_strings.copy(), set(cond_strings), []))
+                stack.append((-1, mark, ()))
+            for child_id, child_conds in edges[node_id]:
+                stack.append((child_id, mark, child_conds))
+        if batch:
+            yield batch
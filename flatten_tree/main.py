@@ -20,17 +20,27 @@ def main():
         default=0,
         help="Root node ID (defaults to 0)"
     )
+    parser.add_argument(
+        "--memoize",
+        action="store_true",
+        help="Cache and replay the strategies of shared subtrees; only faster when large shared subtrees "
+             "are reached again under the same constraints on their variables (uses more memory)"
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes (defaults to 1); with more than one, strategies are written in no particular order"
+    )
     args = parser.parse_args()
 
     # Parse the input tree file.
     tree_parser = TreeParser(args.input_path)
     nodes = tree_parser.parse()
 
-    # Flatten the tree into strategies.
-    flattener = TreeFlattener(nodes)
-    with open(args.output_path, "w", encoding="utf-8") as out_f:
-        for strategy in flattener.flatten(args.root_id):
-            out_f.write(strategy + "\n")
+    # Flatten the tree into strategies, written in batches through one buffered writer.
+    flattener = TreeFlattener(nodes, memoize=args.memoize)
+    flattener.flatten_to_file(args.output_path, args.root_id, processes=args.jobs)
 
 if __name__ == "__main__":
     main()
@@ -1,85 +1,155 @@
+import os
 import re
-from typing import Dict
-from .datamodel import TreeNode, Condition, OrCondition
+import sys
+from typing import IO, Dict, Tuple, Union
+from .datamodel import KIND_LEAF, KIND_OR, KIND_SINGLE, TreeArrays, Condition, max_node_id, node_id_error
+
+# A whole node line, either "ID:[condition] yes=child_yes,no=child_no" or "ID:leaf=value".
+# Whitespace before the colon and around the leaf value is allowed, as is trailing text after
+# the no branch.
+_LINE_RE = re.compile(
+    rb"(?P<id>\d+)\s*:(?:\[(?P<cond>[^\]]+)\]\s*yes=(?P<yes>\d+),no=(?P<no>\d+)(?:\D.*)?"
+    rb"|leaf=\s*(?P<leaf>[-+]?(?:(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|(?i:inf(?:inity)?|nan)))\s*)",
+    re.DOTALL
+)
+
+# Smallest read used by read_file once the fstat size is used up or unknown (pipes, /proc).
+READ_CHUNK_SIZE = 1 << 16
+
+# Separator between the two halves of an OR condition.
+OR_DELIMITER = b"||or||"
+
+# A simple condition such as "browser=8" or "os_family!=5". The variable may contain "!" but not
+# "=" or "!="; the value may not contain "=".
+_COND_RE = re.compile(rb"\s*(?P<var>(?:[^=!]|!(?!=))+?)\s*(?P<op>!=|=)\s*(?P<val>[^=]+?)\s*")
+
+def _parse_condition(cond_str: bytes) -> Condition:
+    """
+    Parses raw bytes such as b'browser=8' or b'os_family!=5' into a Condition.
+    Variable names and operators are interned, since the same few strings recur on many nodes.
+    Values are not interned: their cardinality is unbounded.
+    """
+    match = _COND_RE.fullmatch(cond_str)
+    if match is None:
+        raise ValueError(f"Unexpected condition format: '{cond_str.decode('utf-8', 'replace')}'")
+    return Condition(variable=sys.intern(match.group("var").decode("utf-8")),
+                     operator=sys.intern(match.group("op").decode("utf-8")),
+                     value=match.group("val").decode("utf-8"))
+
+def read_file(path: str) -> bytes:
+    """
+    Reads the whole file at path with raw os.read calls, skipping the buffered file object layer.
+    A regular file is read with one call sized from fstat; anything else (or a file that grows)
+    in reads of at least READ_CHUNK_SIZE bytes.
+    """
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_CLOEXEC", 0))
+    try:
+        size = os.fstat(fd).st_size
+        chunks = []
+        while True:
+            chunk = os.read(fd, max(size, READ_CHUNK_SIZE))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size -= len(chunk)
+    finally:
+        os.close(fd)
+    return chunks[0] if len(chunks) == 1 else b"".join(chunks)
 
 class TreeParser:
-    def __init__(self, file_path: str):
-        self.file_path = file_path
+    def __init__(self, source: Union[str, os.PathLike, bytes, IO[bytes]]):
+        """
+        source: the tree file, given as a path, as its raw contents, or as a binary file-like
+        object to read them from.
+        """
+        self.source = source
+
+    def parse(self) -> TreeArrays:
+        """
+        Reads the tree source and returns the tree as TreeArrays, whose rows are indexed by node ID
+        and read back as TreeNode objects.
+        The source is read whole as raw bytes; only the variable names and values of distinct
+        conditions are ever decoded (as UTF-8) to str. Its lines are counted first so the columns can be
+        allocated once, as node IDs are dense.
+        """
+        data = self._read_source()
+        tree = TreeArrays()
+        n_lines = data.count(b"\n") + 1
+        tree.resize(n_lines)
+        max_id = max_node_id(n_lines)
+        # The row in tree.conditions of each raw simple condition, so each distinct condition is
+        # parsed once and shared, and the (kind, cond_a, cond_b) columns of each raw node condition.
+        cond_rows: Dict[bytes, int] = {}
+        node_conds: Dict[bytes, Tuple[int, int, int]] = {}
+        size = 0
+        for line in data.split(b"\n"):
+            line = line.strip()
+            if not line:
+                continue
+            size = max(size, self._parse_line(line, tree, max_id, cond_rows, node_conds) + 1)
+        tree.resize(size)
+        return tree
 
-    def parse(self) -> Dict[int, TreeNode]:
+    def _read_source(self) -> bytes:
         """
-        Reads the input file and returns a dictionary mapping node IDs to TreeNode objects.
+        Returns the raw contents of the source, reading a path with read_file.
         """
-        nodes: Dict[int, TreeNode] = {}
-        with open(self.file_path, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                node_id_str, rest = line.split(":", 1)
-                node_id = int(node_id_str)
-                node = self._parse_line(node_id, rest)
-                nodes[node_id] = node
-        return nodes
+        source = self.source
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return bytes(source)
+        if hasattr(source, "read"):
+            return source.read()
+        return read_file(source)
 
-    def _parse_line(self, node_id: int, raw_line: str) -> TreeNode:
+    def _parse_line(
+        self, line: bytes, tree: TreeArrays, max_id: int,
+        cond_rows: Dict[bytes, int], node_conds: Dict[bytes, Tuple[int, int, int]]
+    ) -> int:
         """
-        Parses a single line (node) from the file.
+        Parses a single line (node) from the file with one match of the line pattern, stores it in
+        its row of tree and returns the node ID.
+        max_id: largest node id accepted. cond_rows, node_conds: the caches of the current parse.
         """
-        if raw_line.startswith("leaf="):
-            leaf_value = float(raw_line.split("=")[1])
-            return TreeNode(
-                node_id=node_id,
-                or_condition=None,
-                single_condition=None,
-                yes_branch=None,
-                no_branch=None,
-                leaf_value=leaf_value
-            )
-        # Expecting a condition line like: [condition] yes=... ,no=...
-        match = re.match(r"\[(.*?)\]\s*yes=(\d+),no=(\d+)", raw_line)
-        if not match:
-            raise ValueError(f"Node {node_id}: unexpected format '{raw_line}'")
-        condition_part = match.group(1)
-        yes_branch = int(match.group(2))
-        no_branch = int(match.group(3))
-        if "||or||" in condition_part:
-            left_str, right_str = condition_part.split("||or||")
-            left_cond = self._parse_single_condition(left_str.strip())
-            right_cond = self._parse_single_condition(right_str.strip())
-            or_cond = OrCondition(left=left_cond, right=right_cond)
-            return TreeNode(
-                node_id=node_id,
-                or_condition=or_cond,
-                single_condition=None,
-                yes_branch=yes_branch,
-                no_branch=no_branch,
-                leaf_value=None
-            )
-        else:
-            single_cond = self._parse_single_condition(condition_part.strip())
-            return TreeNode(
-                node_id=node_id,
-                or_condition=None,
-                single_condition=single_cond,
-                yes_branch=yes_branch,
-                no_branch=no_branch,
-                leaf_value=None
-            )
+        match = _LINE_RE.fullmatch(line)
+        if match is None:
+            raise ValueError(f"Unexpected node format: '{line.decode('utf-8', 'replace')}'")
+        # One groups() call fetches every field; int() converts the digit bytes directly.
+        node_id_str, cond_str, yes_str, no_str, leaf_str = match.groups()
+        node_id = int(node_id_str)
+        if node_id >= len(tree):
+            if node_id > max_id:
+                raise node_id_error(node_id, max_id)
+            tree.resize(node_id + 1)
+        if leaf_str is not None:
+            tree.kind[node_id] = KIND_LEAF
+            tree.leaf[node_id] = float(leaf_str)
+            return node_id
+        yes_branch, no_branch = int(yes_str), int(no_str)
+        if yes_branch > max_id or no_branch > max_id:
+            raise node_id_error(max(yes_branch, no_branch), max_id)
+        tree.yes[node_id] = yes_branch
+        tree.no[node_id] = no_branch
+        node_cond = node_conds.get(cond_str)
+        if node_cond is None:
+            idx = cond_str.find(OR_DELIMITER)
+            if idx != -1:
+                right = cond_str[idx + len(OR_DELIMITER):]
+                node_cond = (KIND_OR,
+                             self._condition_row(cond_str[:idx], tree, cond_rows),
+                             self._condition_row(right, tree, cond_rows))
+            else:
+                node_cond = (KIND_SINGLE, self._condition_row(cond_str, tree, cond_rows), -1)
+            node_conds[cond_str] = node_cond
+        tree.kind[node_id], tree.cond_a[node_id], tree.cond_b[node_id] = node_cond
+        return node_id
 
-    def _parse_single_condition(self, cond_str: str) -> Condition:
+    def _condition_row(self, cond_str: bytes, tree: TreeArrays, cond_rows: Dict[bytes, int]) -> int:
         """
-        Parses a string such as 'browser=8' or 'os_family!=5' into a Condition.
+        Returns the row of the simple condition cond_str in tree.conditions, parsing and adding it
+        the first time it is seen (recorded in cond_rows).
         """
-        if "!=" in cond_str:
-            variable, value = cond_str.split("!=")
-            return Condition(variable=variable.strip(),
-                             operator="!=",
-                             value=value.strip())
-        elif "=" in cond_str:
-            variable, value = cond_str.split("=")
-            return Condition(variable=variable.strip(),
-                             operator="=",
-                             value=value.strip())
-        else:
-            raise ValueError(f"Unexpected condition format: '{cond_str}'")
\ No newline at end of file
+        row = cond_rows.get(cond_str)
+        if row is None:
+            row = cond_rows[cond_str] = len(tree.conditions)
+            tree.conditions.append(_parse_condition(cond_str))
+        return row
@@ -1,6 +1,9 @@
+import os
 import pytest
 from flatten_tree.datamodel import TreeNode, OrCondition, Condition
-from flatten_tree.flattener import TreeFlattener
+from flatten_tree import flattener as flattener_module
+from flatten_tree.flattener import TreeFlattener, write_all
+from flatten_tree.parser import TreeParser
 
 def test_flattener_single_condition_streaming():
     """
@@ -280,3 +283,376 @@ def test_flattener_generator_streaming():
     assert hasattr(strategy_gen, "__iter__")
     first = next(strategy_gen)
     assert isinstance(first, str)
+
+def test_flattener_flatten_to_file(tmp_path):
+    """
+    The batch mode writes the same strategies as flatten(), one per line.
+    """
+    or_cond = OrCondition(
+        left=Condition("device_type", "=", "pc"),
+        right=Condition("browser", "=", "7")
+    )
+    nodes = {
+        0: TreeNode(
+            node_id=0,
+            or_condition=or_cond,
+            single_condition=None,
+            yes_branch=1,
+            no_branch=2,
+            leaf_value=None
+        ),
+        1: TreeNode(
+            node_id=1,
+            or_condition=None,
+            single_condition=Condition("browser", "!=", "7"),
+            yes_branch=3,
+            no_branch=4,
+            leaf_value=None
+        ),
+        2: TreeNode(
+            node_id=2,
+            or_condition=None,
+            single_condition=None,
+            yes_branch=None,
+            no_branch=None,
+            leaf_value=0.222
+        ),
+        3: TreeNode(
+            node_id=3,
+            or_condition=None,
+            single_condition=None,
+            yes_branch=None,
+            no_branch=None,
+            leaf_value=0.333
+        ),
+        4: TreeNode(
+            node_id=4,
+            or_condition=None,
+            single_condition=None,
+            yes_branch=None,
+            no_branch=None,
+            leaf_value=0.444
+        ),
+    }
+    flattener = TreeFlattener(nodes)
+    output_path = tmp_path / "strategies.txt"
+    flattener.flatten_to_file(str(output_path), root_id=0)
+
+    lines = output_path.read_text().splitlines()
+    assert lines == list(flattener.flatten(root_id=0))
+    assert lines == [
+        "device_type=pc & browser!=7 : 0.333",
+        "device_type=pc & browser=7 : 0.444",
+        "browser=7 : 0.444",
+        "device_type!=pc & browser!=7 : 0.222",
+    ]
+
+def test_flattener_from_parsed_tree_arrays():
+    """
+    A parsed tree is compiled straight from its columns, with the same result as the same
+    tree given as TreeNode objects.
+    """
+    content = b"""\
+0:[device_type=pc||or||browser=7] yes=1,no=2
+1:[browser!=7] yes=3,no=4
+2:leaf=0.222
+3:leaf=0.333
+4:leaf=0.444
+"""
+    tree = TreeParser(content).parse()
+    strategies = list(TreeFlattener(tree).flatten(root_id=0))
+
+    assert strategies == list(TreeFlattener({node.node_id: node for node in tree}).flatten(root_id=0))
+    assert strategies == [
+        "device_type=pc & browser!=7 : 0.333",
+        "device_type=pc & browser=7 : 0.444",
+        "browser=7 : 0.444",
+        "device_type!=pc & browser!=7 : 0.222",
+    ]
+
+def test_write_all_more_chunks_than_iov_max(tmp_path):
+    """
+    More small chunks than one writev call accepts are written in order.
+    """
+    chunks = [b"%d\n" % i for i in range(3000)]
+    output_path = tmp_path / "chunks.txt"
+    fd = os.open(str(output_path), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        write_all(fd, chunks)
+    finally:
+        os.close(fd)
+    assert output_path.read_bytes() == b"".join(chunks)
+
+def test_flattener_memoize_matches_plain_dfs(monkeypatch):
+    """
+    Tree whose OR node sends both alternatives into the same subtree:
+      Node 0: [a=1||or||b=2] yes->1, no->2
+      Node 1: [c=3] yes->3, no->4
+      Node 2: leaf=0.2
+      Node 3: leaf=0.3
+      Node 4: leaf=0.4
+    Node 1's subtree does not mention a or b, so the second visit replays the
+    cached suffixes. The memoized output must match the plain DFS exactly.
+    """
+    nodes = {
+        0: TreeNode(
+            node_id=0,
+            or_condition=OrCondition(Condition("a", "=", "1"), Condition("b", "=", "2")),
+            single_condition=None,
+            yes_branch=1,
+            no_branch=2,
+            leaf_value=None
+        ),
+        1: TreeNode(
+            node_id=1,
+            or_condition=None,
+            single_condition=Condition("c", "=", "3"),
+            yes_branch=3,
+            no_branch=4,
+            leaf_value=None
+        ),
+        2: TreeNode(
+            node_id=2,
+            or_condition=None,
+            single_condition=None,
+            yes_branch=None,
+            no_branch=None,
+            leaf_value=0.2
+        ),
+        3: TreeNode(
+            node_id=3,
+            or_condition=None,
+            single_condition=None,
+            yes_branch=None,
+            no_branch=None,
+            leaf_value=0.3
+        ),
+        4: TreeNode(
+            node_id=4,
+            or_condition=None,
+            single_condition=None,
+            yes_branch=None,
+            no_branch=None,
+            leaf_value=0.4
+        ),
+    }
+    plain = list(TreeFlattener(nodes).flatten(root_id=0))
+    recorded = []
+    record_leaf = flattener_module.record_leaf
+
+    def counting_record_leaf(recorders, path, leaf_text):
+        recorded.append(leaf_text)
+        record_leaf(recorders, path, leaf_text)
+
+    monkeypatch.setattr(flattener_module, "record_leaf", counting_record_leaf)
+    memoized = list(TreeFlattener(nodes, memoize=True).flatten(root_id=0))
+
+    assert memoized == plain
+    # Only the first visit to node 1 explores (and records) its two leaves; the second replays them.
+    assert len(recorded) == 2
+    assert memoized == [
+        "a=1 & c=3 : 0.3",
+        "a=1 & c!=3 : 0.4",
+        "b=2 & c=3 : 0.3",
+        "b=2 & c!=3 : 0.4",
+        "a!=1 & b!=2 : 0.2",
+    ]
+
+def test_flattener_parallel_matches_sequential():
+    """
+    flatten_parallel yields the same strategies as flatten(), in any order.
+    """
+    nodes = {
+        0: TreeNode(
+            node_id=0,
+            or_condition=OrCondition(Condition("a", "=", "1"), Condition("b", "=", "2")),
+            single_condition=None,
+            yes_branch=1,
+            no_branch=2,
+            leaf_value=None
+        ),
+        1: TreeNode(
+            node_id=1,
+            or_condition=None,
+            single_condition=Condition("a", "!=", "1"),
+            yes_branch=3,
+            no_branch=4,
+            leaf_value=None
+        ),
+        2: TreeNode(
+            node_id=2,
+            or_condition=None,
+            single_condition=Condition("b", "=", "3"),
+            yes_branch=3,
+            no_branch=4,
+            leaf_value=None
+        ),
+        3: TreeNode(
+            node_id=3,
+            or_condition=None,
+            single_condition=None,
+            yes_branch=None,
+            no_branch=None,
+            leaf_value=0.3
+        ),
+        4: TreeNode(
+            node_id=4,
+            or_condition=None,
+            single_condition=None,
+            yes_branch=None,
+            no_branch=None,
+            leaf_value=0.4
+        ),
+    }
+    flattener = TreeFlattener(nodes)
+    parallel = list(flattener.flatten_parallel(root_id=0, processes=2))
+
+    assert sorted(parallel) == sorted(flattener.flatten(root_id=0))
+    assert len(parallel) == 5
+
+def test_flattener_splits_seeds_past_single_edge_nodes():
+    """
+    Node 0 has only a YES branch, so the first level does not grow the seed count; expansion
+    must still continue down to the leaves below node 1.
+    """
+    nodes = {
+        0: TreeNode(
+            node_id=0,
+            or_condition=None,
+            single_condition=Condition("a", "=", "1"),
+            yes_branch=1,
+            no_branch=None,
+            leaf_value=None
+        ),
+        1: TreeNode(
+            node_id=1,
+            or_condition=None,
+            single_condition=Condition("b", "=", "2"),
+            yes_branch=2,
+            no_branch=3,
+            leaf_value=None
+        ),
+        2: TreeNode(
+            node_id=2,
+            or_condition=None,
+            single_condition=None,
+            yes_branch=None,
+            no_branch=None,
+            leaf_value=0.2
+        ),
+        3: TreeNode(
+            node_id=3,
+            or_condition=None,
+            single_condition=None,
+            yes_branch=None,
+            no_branch=None,
+            leaf_value=0.3
+        ),
+    }
+    flattener = TreeFlattener(nodes)
+    seeds = flattener._split_seeds(0, 16)
+
+    assert [node_id for node_id, _ in seeds] == [2, 3]
+
+def test_flattener_rejects_negative_node_id():
+    """
+    A negative id would wrap around the dense node tables and overwrite another node.
+    """
+    nodes = {
+        0: TreeNode(
+            node_id=0,
+            or_condition=None,
+            single_condition=Condition("a", "=", "1"),
+            yes_branch=1,
+            no_branch=-1,
+            leaf_value=None
+        ),
+        1: TreeNode(
+            node_id=1,
+            or_condition=None,
+            single_condition=None,
+            yes_branch=None,
+            no_branch=None,
+            leaf_value=0.1
+        ),
+        -1: TreeNode(
+            node_id=-1,
+            or_condition=None,
+            single_condition=None,
+            yes_branch=None,
+            no_branch=None,
+            leaf_value=0.9
+        ),
+    }
+    with pytest.raises(ValueError, match="Node id -1 is out of range"):
+        TreeFlattener(nodes)
+
+def test_flattener_sparse_node_ids():
+    """
+    Dict trees whose ids are too sparse to index the tables directly are renumbered.
+    """
+    nodes = {
+        0: TreeNode(
+            node_id=0,
+            or_condition=None,
+            single_condition=Condition("a", "=", "1"),
+            yes_branch=1,
+            no_branch=1000000,
+            leaf_value=None
+        ),
+        1: TreeNode(
+            node_id=1,
+            or_condition=None,
+            single_condition=None,
+            yes_branch=None,
+            no_branch=None,
+            leaf_value=0.1
+        ),
+        1000000: TreeNode(
+            node_id=1000000,
+            or_condition=None,
+            single_condition=None,
+            yes_branch=None,
+            no_branch=None,
+            leaf_value=0.9
+        ),
+    }
+    flattener = TreeFlattener(nodes)
+    assert list(flattener.flatten()) == ["a=1 : 0.1", "a!=1 : 0.9"]
+    assert list(flattener.flatten(1000000)) == [": 0.9"]
+    with pytest.raises(ValueError, match="Unknown root node 2"):
+        list(flattener.flatten(2))
+
+def test_flattener_rejects_cycle():
+    """
+    Node 1 leads back to node 0, so the tree has no finite set of strategies.
+    """
+    nodes = {
+        0: TreeNode(
+            node_id=0,
+            or_condition=None,
+            single_condition=Condition("a", "=", "1"),
+            yes_branch=1,
+            no_branch=2,
+            leaf_value=None
+        ),
+        1: TreeNode(
+            node_id=1,
+            or_condition=None,
+            single_condition=Condition("b", "=", "2"),
+            yes_branch=0,
+            no_branch=2,
+            leaf_value=None
+        ),
+        2: TreeNode(
+            node_id=2,
+            or_condition=None,
+            single_condition=None,
+            yes_branch=None,
+            no_branch=None,
+            leaf_value=0.2
+        ),
+    }
+    for memoize in (False, True):
+        with pytest.raises(ValueError, match="cycle"):
+            TreeFlattener(nodes, memoize=memoize)
@@ -1,7 +1,8 @@
 import pytest
+from io import BytesIO
 from pathlib import Path
 from flatten_tree.parser import TreeParser
-from flatten_tree.datamodel import OrCondition, Condition
+from flatten_tree.datamodel import OrCondition, Condition, KIND_NONE, KIND_LEAF, KIND_SINGLE, KIND_OR
 
 def test_parser_single_condition(tmp_path):
     content = """\
@@ -10,7 +11,7 @@ def test_parser_single_condition(tmp_path):
 2:leaf=0.2
 """
     file_path = tmp_path / "tree_to_convert.txt"
-    file_path.write_text(content)
+    file_path.write_bytes(content.encode("ascii"))
     parser = TreeParser(str(file_path))
     nodes = parser.parse()
     assert len(nodes) == 3
@@ -27,10 +28,108 @@ def test_parser_or_condition(tmp_path):
 2:leaf=0.222
 """
     file_path = tmp_path / "tree_to_convert.txt"
-    file_path.write_text(content)
+    file_path.write_bytes(content.encode("ascii"))
     parser = TreeParser(str(file_path))
     nodes = parser.parse()
     node0 = nodes[0]
     assert node0.or_condition is not None
     assert node0.or_condition.left == Condition("device_type", "=", "pc")
     assert node0.or_condition.right == Condition("browser", "=", "7")
+
+def test_parser_shares_repeated_conditions(tmp_path):
+    content = """\
+0:[browser=8] yes=1,no=2
+1:[os_family=5||or||browser=8] yes=3,no=4
+2:[browser=8] yes=3,no=4
+3:leaf=0.1
+4:leaf=0.2
+"""
+    file_path = tmp_path / "tree_to_convert.txt"
+    file_path.write_bytes(content.encode("ascii"))
+    parser = TreeParser(str(file_path))
+    nodes = parser.parse()
+    assert nodes[0].single_condition is nodes[2].single_condition
+    assert nodes[1].or_condition.right is nodes[0].single_condition
+    assert nodes[1].or_condition.left == Condition("os_family", "=", "5")
+
+def test_parser_indexes_nodes_by_id(tmp_path):
+    content = """\
+2:leaf=0.2
+0:[browser=8] yes=1,no=2
+1:leaf=0.1"""
+    file_path = tmp_path / "tree_to_convert.txt"
+    file_path.write_bytes(content.encode("ascii"))
+    parser = TreeParser(str(file_path))
+    nodes = parser.parse()
+    assert [node.node_id for node in nodes] == [0, 1, 2]
+    assert nodes[2].leaf_value == 0.2
+
+def test_parser_fills_tree_arrays(tmp_path):
+    content = """\
+0:[browser=8] yes=1,no=4
+1:[os_family=5||or||browser=8] yes=3,no=4
+3:leaf=0.3
+4:leaf=0.4
+"""
+    file_path = tmp_path / "tree_to_convert.txt"
+    file_path.write_bytes(content.encode("ascii"))
+    parser = TreeParser(str(file_path))
+    tree = parser.parse()
+    assert len(tree) == 5
+    assert list(tree.kind) == [KIND_SINGLE, KIND_OR, KIND_NONE, KIND_LEAF, KIND_LEAF]
+    assert list(tree.cond_a) == [0, 1, -1, -1, -1]
+    assert list(tree.cond_b) == [-1, 0, -1, -1, -1]
+    assert list(tree.yes) == [1, 3, -1, -1, -1]
+    assert list(tree.no) == [4, 4, -1, -1, -1]
+    assert tree.conditions == [Condition("browser", "=", "8"), Condition("os_family", "=", "5")]
+    assert tree[1].or_condition == OrCondition(Condition("os_family", "=", "5"), Condition("browser", "=", "8"))
+    assert tree[2] is None
+    assert tree[3].leaf_value == 0.3
+
+def test_parser_reads_file_like_and_bytes():
+    content = b"""\
+0:[browser=8] yes=1,no=2
+1:leaf=0.1
+2:leaf=0.2
+"""
+    for source in (BytesIO(content), content):
+        nodes = TreeParser(source).parse()
+        assert len(nodes) == 3
+        assert nodes[0].single_condition == Condition("browser", "=", "8")
+        assert nodes[2].leaf_value == 0.2
+
+def test_parser_utf8_condition(tmp_path):
+    content = """\
+0:[région=Île-de-France] yes=1,no=2
+1:leaf=0.1
+2:leaf=0.2
+"""
+    file_path = tmp_path / "tree_to_convert.txt"
+    file_path.write_bytes(content.encode("utf-8"))
+    parser = TreeParser(str(file_path))
+    nodes = parser.parse()
+    assert nodes[0].single_condition == Condition("région", "=", "Île-de-France")
+
+def test_parser_rejects_sparse_node_id():
+    content = b"""\
+0:[browser=8] yes=1,no=99999999
+1:leaf=0.1
+99999999:leaf=0.2
+"""
+    with pytest.raises(ValueError, match="Node id 99999999 is out of range"):
+        TreeParser(content).parse()
+
+def test_parser_rejects_malformed_leaf():
+    with pytest.raises(ValueError, match="Unexpected node format: '1:leaf=0.1,x'"):
+        TreeParser(b"0:[browser=8] yes=1,no=1\n1:leaf=0.1,x\n").parse()
+
+def test_parser_tolerates_spacing_and_trailing_text():
+    content = b"0 :[a!b=1] yes=1,no=2 # root\n1:leaf= 0.1\n2:leaf=0.9 \n"
+    nodes = TreeParser(content).parse()
+    assert nodes[0].single_condition == Condition("a!b", "=", "1")
+    assert (nodes[0].yes_branch, nodes[0].no_branch) == (1, 2)
+    assert nodes[1].leaf_value == 0.1
+
+def test_parser_rejects_condition_with_two_equals():
+    with pytest.raises(ValueError, match="Unexpected condition format: 'a=1=2'"):
+        TreeParser(b"0:[a=1=2] yes=1,no=1\n1:leaf=0.1\n").parse()